@@ -14,13 +14,17 @@
  *   WRAPPED_MONERO_ADDRESS - Address of WrappedMonero contract
  *   RPC_URL - Ethereum RPC URL (default: Base Sepolia)
  *   MONERO_RPC_URL - Monero RPC URL (default: mainnet)
+ *   MONERO_RPC_TIMEOUT_MS - Monero RPC request timeout in milliseconds (default: 10000)
  *   INTERVAL_MS - Polling interval in milliseconds (default: 120000 = 2 min)
  */
 
 require('dotenv').config();
 const hre = require('hardhat');
 const axios = require('axios');
+const crypto = require('crypto');
 const fs = require('fs');
+const http = require('http');
+const https = require('https');
 const path = require('path');
 
 // Try to load deployment info
@@ -37,6 +41,7 @@ const config = {
     bridgeAddress: process.env.BRIDGE_ADDRESS || (deploymentInfo ? deploymentInfo.bridge : null),
     rpcUrl: process.env.RPC_URL || 'http://localhost:8545',
     moneroRpcUrl: process.env.MONERO_RPC_URL || 'https://stagenet.xmr.ditatompel.com',
+    moneroRpcTimeoutMs: parseInt(process.env.MONERO_RPC_TIMEOUT_MS || '10000'),
     intervalMs: parseInt(process.env.INTERVAL_MS || '120000'), // 2 minutes
 };
 
@@ -53,13 +58,27 @@ if (!config.bridgeAddress) {
     process.exit(1);
 }
 
+// Number of get_block calls kept in flight ahead of the block being posted
+const BLOCK_PREFETCH_DEPTH = 4;
+
+// Shared Monero RPC client - keep-alive agents reuse the TCP/TLS connection
+// across the header, block and transaction calls made on every poll.
+// The timeout keeps a stalled node from hanging the poll chain indefinitely.
+const moneroRpc = axios.create({
+    baseURL: config.moneroRpcUrl,
+    timeout: config.moneroRpcTimeoutMs,
+    httpAgent: new http.Agent({ keepAlive: true, maxSockets: BLOCK_PREFETCH_DEPTH }),
+    httpsAgent: new https.Agent({ keepAlive: true, maxSockets: BLOCK_PREFETCH_DEPTH }),
+    headers: { 'Content-Type': 'application/json' }
+});
+
 // Monero RPC helper - Get block header
 async function getMoneroBlockHeader(height = null) {
     try {
         const method = height !== null ? 'get_block_header_by_height' : 'get_last_block_header';
         const params = height !== null ? { height } : {};
         
-        const response = await axios.post(config.moneroRpcUrl + '/json_rpc', {
+        const response = await moneroRpc.post('/json_rpc', {
             jsonrpc: '2.0',
             id: '0',
             method,
@@ -77,35 +96,35 @@ async function getMoneroBlockHeader(height = null) {
     }
 }
 
+// Fetch full block without logging failures (used directly for prefetching)
+async function fetchMoneroBlock(height) {
+    const response = await moneroRpc.post('/json_rpc', {
+        jsonrpc: '2.0',
+        id: '0',
+        method: 'get_block',
+        params: { height }
+    });
+    
+    if (response.data.error) {
+        throw new Error(response.data.error.message);
+    }
+    
+    return response.data.result;
+}
+
 // Get full block with transactions (for Merkle root)
 async function getMoneroBlock(height) {
     try {
-        const response = await axios.post(config.moneroRpcUrl + '/json_rpc', {
-            jsonrpc: '2.0',
-            id: '0',
-            method: 'get_block',
-            params: { height }
-        });
-        
-        if (response.data.error) {
-            throw new Error(response.data.error.message);
-        }
-        
-        return response.data.result;
+        return await fetchMoneroBlock(height);
     } catch (error) {
         console.error('❌ Monero RPC error:', error.message);
         throw error;
     }
 }
 
-// Extract outputs from block
-async function extractOutputsFromBlock(blockHeight) {
+// Extract outputs from block (txHashes come from the block JSON already parsed by the caller)
+async function extractOutputsFromBlock(blockHeight, txHashes) {
     try {
-        // Get full block
-        const blockData = await getMoneroBlock(blockHeight);
-        const blockJson = JSON.parse(blockData.json);
-        const txHashes = blockJson.tx_hashes || [];
-        
         if (txHashes.length === 0) {
             console.log(`   No transactions in block ${blockHeight}`);
             return [];
@@ -113,15 +132,16 @@ async function extractOutputsFromBlock(blockHeight) {
         
         console.log(`   Fetching ${txHashes.length} transaction(s) from block...`);
         
-        // Fetch all transactions
-        const response = await axios.post(config.moneroRpcUrl + '/get_transactions', {
+        // Fetch all transactions - pruned, since only vout and the non-prunable
+        // rct_signatures (ecdhInfo, outPk) are needed, not range proofs/ring signatures
+        const response = await moneroRpc.post('/get_transactions', {
             txs_hashes: txHashes,
-            decode_as_json: true
+            decode_as_json: true,
+            prune: true
         });
         
         if (response.data.status !== 'OK' || !response.data.txs) {
-            console.error('   ⚠️  Failed to fetch transactions');
-            return [];
+            throw new Error(`get_transactions failed (status: ${response.data.status})`);
         }
         
         const allOutputs = [];
@@ -132,11 +152,16 @@ async function extractOutputsFromBlock(blockHeight) {
             const txHash = tx.tx_hash;
             
             // Extract each output
-            if (txJson.vout && txJson.rct_signatures) {
-                for (let i = 0; i < txJson.vout.length; i++) {
-                    const output = txJson.vout[i];
-                    const ecdh = txJson.rct_signatures.ecdhInfo ? txJson.rct_signatures.ecdhInfo[i] : null;
-                    const commitment = txJson.rct_signatures.outPk ? txJson.rct_signatures.outPk[i] : null;
+            const vout = txJson.vout;
+            const rct = txJson.rct_signatures;
+            if (vout && rct) {
+                const ecdhInfo = rct.ecdhInfo;
+                const outPk = rct.outPk;
+                
+                for (let i = 0; i < vout.length; i++) {
+                    const output = vout[i];
+                    const ecdh = ecdhInfo ? ecdhInfo[i] : null;
+                    const commitment = outPk ? outPk[i] : null;
                     
                     // Handle both old format (target.key) and new format (target.tagged_key.key)
                     let outputPubKey = null;
@@ -165,8 +190,10 @@ async function extractOutputsFromBlock(blockHeight) {
         return allOutputs;
         
     } catch (error) {
-        console.error(`   ⚠️  Error extracting outputs: ${error.message}`);
-        return [];
+        // Never fall back to an empty output set - posting a wrong output root
+        // is permanent, so abort the poll and retry the block next time
+        console.error(`   ❌ Error extracting outputs: ${error.message}`);
+        throw error;
     }
 }
 
@@ -190,12 +217,12 @@ function computeTxMerkleRoot(txHashes) {
             if (i + 1 < level.length) {
                 // Hash pair
                 const combined = Buffer.concat([level[i], level[i + 1]]);
-                const hash = require('crypto').createHash('sha256').update(combined).digest();
+                const hash = crypto.createHash('sha256').update(combined).digest();
                 nextLevel.push(hash);
             } else {
                 // Odd number - duplicate last hash
                 const combined = Buffer.concat([level[i], level[i]]);
-                const hash = require('crypto').createHash('sha256').update(combined).digest();
+                const hash = crypto.createHash('sha256').update(combined).digest();
                 nextLevel.push(hash);
             }
         }
@@ -245,12 +272,12 @@ function computeOutputMerkleRoot(outputs) {
             if (i + 1 < level.length) {
                 // Hash pair
                 const combined = Buffer.concat([level[i], level[i + 1]]);
-                const hash = require('crypto').createHash('sha256').update(combined).digest();
+                const hash = crypto.createHash('sha256').update(combined).digest();
                 nextLevel.push(hash);
             } else {
                 // Odd number - duplicate last hash
                 const combined = Buffer.concat([level[i], level[i]]);
-                const hash = require('crypto').createHash('sha256').update(combined).digest();
+                const hash = crypto.createHash('sha256').update(combined).digest();
                 nextLevel.push(hash);
             }
         }
@@ -264,10 +291,12 @@ function computeOutputMerkleRoot(outputs) {
 // Post block to contract
 async function postBlock(contract, blockHeight, blockHash, txMerkleRoot, outputMerkleRoot) {
     try {
-        console.log(`\n📤 Posting block ${blockHeight} to contract...`);
-        console.log(`   Hash: ${blockHash}`);
-        console.log(`   TX Merkle Root: ${txMerkleRoot}`);
-        console.log(`   Output Merkle Root: ${outputMerkleRoot}`);
+        console.log([
+            `\n📤 Posting block ${blockHeight} to contract...`,
+            `   Hash: ${blockHash}`,
+            `   TX Merkle Root: ${txMerkleRoot}`,
+            `   Output Merkle Root: ${outputMerkleRoot}`
+        ].join('\n'));
         
         const tx = await contract.postMoneroBlock(
             blockHeight,
@@ -309,7 +338,21 @@ async function runOracle() {
     
     console.log(`\n👤 Oracle address: ${wallet.address}`);
     
-    const balance = await provider.getBalance(wallet.address);
+    // Load contract
+    const WrappedMonero = await hre.ethers.getContractFactory('WrappedMonero');
+    const contract = WrappedMonero.attach(config.bridgeAddress).connect(wallet);
+    
+    // Balance and oracle role checks are independent - query them concurrently,
+    // but report their outcomes in order so a zero balance is reported first
+    const [balanceResult, oracleResult] = await Promise.allSettled([
+        provider.getBalance(wallet.address),
+        contract.oracle()
+    ]);
+    
+    if (balanceResult.status === 'rejected') {
+        throw balanceResult.reason;
+    }
+    const balance = balanceResult.value;
     console.log(`   Balance: ${hre.ethers.formatEther(balance)} ETH`);
     
     if (balance === 0n) {
@@ -317,12 +360,11 @@ async function runOracle() {
         process.exit(1);
     }
     
-    // Load contract
-    const WrappedMonero = await hre.ethers.getContractFactory('WrappedMonero');
-    const contract = WrappedMonero.attach(config.bridgeAddress).connect(wallet);
-    
     // Verify oracle role
-    const contractOracle = await contract.oracle();
+    if (oracleResult.status === 'rejected') {
+        throw oracleResult.reason;
+    }
+    const contractOracle = oracleResult.value;
     if (contractOracle.toLowerCase() !== wallet.address.toLowerCase()) {
         console.error(`\n❌ Wallet is not the oracle!`);
         console.error(`   Contract oracle: ${contractOracle}`);
@@ -335,6 +377,7 @@ async function runOracle() {
     
     // Main loop
     let lastPostedBlock = 0;
+    let syncedTipHash = null; // Monero tip hash the contract was last confirmed up to date with
     
     async function poll() {
         try {
@@ -348,6 +391,12 @@ async function runOracle() {
             console.log(`   Latest Monero block: ${blockHeight}`);
             console.log(`   Hash: ${blockHash}`);
             
+            // Tip unchanged since the last successful sync - nothing to check or post
+            if (blockHash === syncedTipHash) {
+                console.log(`   ✅ No new block since last poll`);
+                return;
+            }
+            
             // Get last posted block from contract
             const latestPosted = await contract.latestMoneroBlock();
             console.log(`   Last posted block: ${latestPosted.toString()}`);
@@ -357,12 +406,27 @@ async function runOracle() {
                 const blocksToPost = blockHeight - Number(latestPosted);
                 console.log(`   📊 ${blocksToPost} new block(s) detected!`);
                 
+                // Fetch upcoming blocks concurrently while earlier ones are posted.
+                // A failed prefetch resolves to null and is refetched when its block
+                // is reached, so a transient error several posts ahead is retried.
+                const prefetched = new Map();
+                const prefetchBlock = (height) => {
+                    if (height <= blockHeight && !prefetched.has(height)) {
+                        prefetched.set(height, fetchMoneroBlock(height).catch(() => null));
+                    }
+                };
+                
                 // Post each block sequentially
                 for (let height = Number(latestPosted) + 1; height <= blockHeight; height++) {
                     console.log(`\n   📦 Processing block ${height}...`);
                     
+                    for (let ahead = height; ahead < height + BLOCK_PREFETCH_DEPTH; ahead++) {
+                        prefetchBlock(ahead);
+                    }
+                    
                     // Get full block with transactions
-                    const blockData = await getMoneroBlock(height);
+                    const blockData = (await prefetched.get(height)) || await getMoneroBlock(height);
+                    prefetched.delete(height);
                     const blockJson = JSON.parse(blockData.json);
                     const txHashes = blockJson.tx_hashes || [];
                     const blockHashForHeight = '0x' + blockData.block_header.hash;
@@ -374,7 +438,7 @@ async function runOracle() {
                     console.log(`      TX Merkle root: ${txMerkleRoot}`);
                     
                     // Extract outputs from block
-                    const outputs = await extractOutputsFromBlock(height);
+                    const outputs = await extractOutputsFromBlock(height, txHashes);
                     console.log(`      Outputs: ${outputs.length}`);
                     
                     // Compute output Merkle root
@@ -389,6 +453,8 @@ async function runOracle() {
                 console.log(`   ✅ Already up to date`);
             }
             
+            syncedTipHash = blockHash;
+            
         } catch (error) {
             console.error('\n❌ Error in oracle loop:', error.message);
             console.error(error.stack);
@@ -398,9 +464,14 @@ async function runOracle() {
     // Initial poll
     await poll();
     
-    // Set up interval
+    // Schedule each poll after the previous one finishes, so a long catch-up
+    // (many blocks to post) never overlaps with the next tick
     console.log(`\n⏰ Polling every ${config.intervalMs / 1000}s...`);
-    setInterval(poll, config.intervalMs);
+    async function scheduleNextPoll() {
+        await poll();
+        setTimeout(scheduleNextPoll, config.intervalMs);
+    }
+    setTimeout(scheduleNextPoll, config.intervalMs);
 }
 
 // Handle shutdown gracefully